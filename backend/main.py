@@ -1,16 +1,17 @@
-from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi import FastAPI, HTTPException, Request, Response, BackgroundTasks
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import os
+import re
 import time
 import traceback
 import asyncio
 from datetime import datetime
 import json
 from pathlib import Path
+from functools import lru_cache
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -40,58 +41,105 @@ _frontend_dir = _root_dir / "frontend"
 app.mount("/static", StaticFiles(directory=str(_frontend_dir)), name="static")
 
 # Helper functions for smart Discord logging
+_AUTOMATED_INDICATORS = (
+    "bot", "crawler", "spider", "monitor", "health", "uptime",
+    "pingdom", "newrelic", "datadog", "nagios", "zabbix",
+    "curl", "wget", "python-requests", "go-http-client",
+    "postman", "insomnia", "httpie"
+)
+_BROWSER_INDICATORS = ("mozilla", "chrome", "firefox", "safari", "edge", "opera")
+_OUR_REFERER_DOMAINS = ("localhost", "127.0.0.1", "prompt-template")
+
+_AUTOMATED_RE = re.compile("|".join(map(re.escape, _AUTOMATED_INDICATORS)), re.IGNORECASE)
+_BROWSER_RE = re.compile("|".join(map(re.escape, _BROWSER_INDICATORS)), re.IGNORECASE)
+
+# Real traffic has few distinct user agents, so classifications are cached per string
+@lru_cache(maxsize=4096)
+def _is_automated_user_agent(user_agent: str) -> bool:
+    """Detect if a user agent belongs to automated tools/bots"""
+    return _AUTOMATED_RE.search(user_agent) is not None
+
+@lru_cache(maxsize=4096)
+def _is_browser_user_agent(user_agent: str) -> bool:
+    """Detect if a user agent belongs to a web browser"""
+    return _BROWSER_RE.search(user_agent) is not None
+
 def _is_automated_request(user_agent: str, referer: str) -> bool:
     """Detect if request is from automated tools/bots"""
-    automated_indicators = [
-        "bot", "crawler", "spider", "monitor", "health", "uptime",
-        "pingdom", "newrelic", "datadog", "nagios", "zabbix",
-        "curl", "wget", "python-requests", "go-http-client",
-        "postman", "insomnia", "httpie"
-    ]
-    
-    user_agent_lower = user_agent.lower()
-    return any(indicator in user_agent_lower for indicator in automated_indicators)
+    return _is_automated_user_agent(user_agent)
 
 def _is_user_initiated_request(user_agent: str, referer: str) -> bool:
     """Detect if request is likely user-initiated"""
     # If it's from a browser with a referer from our domain, it's likely user-initiated
-    if referer and any(domain in referer for domain in ["localhost", "127.0.0.1", "prompt-template"]):
-        browser_indicators = ["mozilla", "chrome", "firefox", "safari", "edge", "opera"]
-        user_agent_lower = user_agent.lower()
-        return any(browser in user_agent_lower for browser in browser_indicators)
+    if referer and any(domain in referer for domain in _OUR_REFERER_DOMAINS):
+        return _is_browser_user_agent(user_agent)
     
     # If no referer but it's a browser, could be direct access
     if not referer:
-        browser_indicators = ["mozilla", "chrome", "firefox", "safari", "edge", "opera"]
-        user_agent_lower = user_agent.lower()
-        return any(browser in user_agent_lower for browser in browser_indicators)
+        return _is_browser_user_agent(user_agent)
     
     return False
 
+# Endpoints to exclude from Discord logging (automated/monitoring calls)
+_EXCLUDED_ENDPOINTS = frozenset({
+    "/api/quota_status",  # Health check/monitoring endpoint
+    "/api/quotas",        # Only log quotas if it's a user-initiated request
+    "/api/health",        # Health check endpoint
+    "/api/status"         # Status endpoint
+})
+
+# Quota endpoints are logged only when they look user-initiated
+_QUOTA_ENDPOINTS = frozenset({"/api/quotas", "/api/quota_status"})
+
+# Methods whose request body is included in the log
+_BODY_METHODS = frozenset({"POST", "PUT", "PATCH"})
+
 # Middleware for Discord logging
 @app.middleware("http")
 async def discord_logging_middleware(request: Request, call_next):
     """Middleware to log all requests to Discord webhook"""
-    start_time = time.time()
+    start_time = time.monotonic()
+    path = request.url.path
+    method = request.method
     
     # Get user details
     user_ip = request.client.host if request.client else "unknown"
     user_agent = request.headers.get("user-agent", "unknown")
     referer = request.headers.get("referer", "")
     
-    # For the main page visit, log as visitor (fire and forget - don't block)
-    if request.url.path == "/" and request.method == "GET":
-        asyncio.create_task(discord_service.send_visitor_log(user_ip, user_agent, referer))
+    # Discord logs are attached to the response and only run after it has been sent.
+    # Without a webhook configured, all logging work below is skipped.
+    logging_enabled = discord_service.enabled
+    log_tasks = BackgroundTasks()
+    log_timestamp = datetime.utcnow().isoformat() if logging_enabled else None
+    
+    # For the main page visit, log as visitor
+    if logging_enabled and path == "/" and method == "GET":
+        log_tasks.add_task(
+            discord_service.enqueue_visitor_log,
+            user_ip,
+            user_agent,
+            referer,
+            timestamp=log_timestamp
+        )
+    
+    # Smart filtering: Log request to Discord only for meaningful user interactions
+    should_log = (
+        logging_enabled and
+        "/api/" in path and 
+        path not in _EXCLUDED_ENDPOINTS and
+        not _is_automated_request(user_agent, referer)
+    )
+    
+    # Special case: Log quota requests only if they seem to be user-initiated
+    if logging_enabled and path in _QUOTA_ENDPOINTS:
+        should_log = _is_user_initiated_request(user_agent, referer)
     
-    # Get request body for logging (if applicable)
+    # Keep the raw body only for requests that will be logged; JSON parsing
+    # happens later in the Discord flusher, off the request path
     request_data = None
-    if request.method in ["POST", "PUT", "PATCH"] and "api" in request.url.path:
-        try:
-            body = await request.body()
-            if body:
-                request_data = json.loads(body.decode())
-        except:
-            request_data = {"body": "Unable to parse request body"}
+    if should_log and method in _BODY_METHODS:
+        request_data = await request.body() or None
     
     response = None
     status_code = 500
@@ -113,57 +161,69 @@ async def discord_logging_middleware(request: Request, call_next):
             media_type="application/json"
         )
         
-        # Log error to Discord (fire and forget - don't block response)
-        asyncio.create_task(discord_service.send_error_log(
-            str(e), 
-            f"{request.method} {request.url.path}",
-            user_ip,
-            traceback.format_exc()
-        ))
+        # Log error to Discord once the error response is out; formatting the
+        # traceback walks the whole stack, so skip it when nobody will see it
+        if logging_enabled:
+            log_tasks.add_task(
+                discord_service.enqueue_error_log,
+                str(e), 
+                f"{method} {path}",
+                user_ip,
+                traceback.format_exc(),
+                timestamp=log_timestamp
+            )
     
     # Calculate processing time
-    processing_time = time.time() - start_time
-    
-    # Define endpoints to exclude from Discord logging (automated/monitoring calls)
-    excluded_endpoints = [
-        "/api/quota_status",  # Health check/monitoring endpoint
-        "/api/quotas",        # Only log quotas if it's a user-initiated request
-        "/api/health",        # Health check endpoint
-        "/api/status"         # Status endpoint
-    ]
-    
-    # Smart filtering: Log request to Discord only for meaningful user interactions
-    should_log = (
-        "/api/" in request.url.path and 
-        request.url.path not in excluded_endpoints and
-        not _is_automated_request(user_agent, referer)
-    )
-    
-    # Special case: Log quota requests only if they seem to be user-initiated
-    if request.url.path in ["/api/quotas", "/api/quota_status"]:
-        should_log = _is_user_initiated_request(user_agent, referer)
+    processing_time = time.monotonic() - start_time
     
     if should_log:
-        # Fire and forget - don't block the response waiting for Discord
-        asyncio.create_task(discord_service.send_request_log(
-            request.method,
-            request.url.path,
+        log_tasks.add_task(
+            discord_service.enqueue_request_log,
+            method,
+            path,
             user_ip,
             user_agent,
             status_code,
             response_data,
             request_data,
-            processing_time
-        ))
+            processing_time,
+            timestamp=log_timestamp
+        )
+    
+    if log_tasks.tasks:
+        response.background = log_tasks
     
     return response
 
+# Responses within the same millisecond share one formatted timestamp
+_last_timestamp = (0, "")
+
+def _iso_now_cached() -> str:
+    """Current local time in ISO format, cached to millisecond granularity"""
+    global _last_timestamp
+    now_ms = time.time_ns() // 1_000_000
+    if now_ms != _last_timestamp[0]:
+        _last_timestamp = (now_ms, datetime.fromtimestamp(now_ms / 1000).isoformat(timespec="milliseconds"))
+    return _last_timestamp[1]
+
 # Initialize services
 prompt_service = PromptTemplateService()
 gemini_service = GeminiService()
 youtube_service = YouTubeService()
 discord_service = DiscordWebhookService()
 
+@app.on_event("startup")
+async def startup_services():
+    """Start background workers for Discord logging and warm up the Gemini client"""
+    discord_service.start()
+    await gemini_service.warm_up()
+
+@app.on_event("shutdown")
+async def shutdown_services():
+    """Release pooled HTTP connections on shutdown"""
+    await discord_service.aclose()
+    await youtube_service.aclose()
+
 # Request models
 class TopicRequest(BaseModel):
     topic: str
@@ -182,18 +242,10 @@ class YouTubeRequest(BaseModel):
     api_key: Optional[str] = None
     max_results: Optional[int] = 60
 
-@app.get("/", response_class=HTMLResponse)
-async def serve_frontend():
-    """Serve the main frontend HTML page"""
-    frontend_path = _root_dir / "frontend" / "index.html"
-    if frontend_path.exists():
-        return FileResponse(frontend_path)
-    return HTMLResponse("<h1>Frontend not found</h1>", status_code=404)
-
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {"status": "healthy", "timestamp": _iso_now_cached()}
 
 @app.post("/api/generate-prompt")
 async def generate_prompt(request: TopicRequest):
@@ -204,7 +256,7 @@ async def generate_prompt(request: TopicRequest):
         return {
             "success": True,
             "data": prompt_data,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _iso_now_cached()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating prompt: {str(e)}")
@@ -220,7 +272,7 @@ async def query_gemini(request: GeminiRequest):
         return {
             "success": True,
             "data": response,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _iso_now_cached()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error querying Gemini: {str(e)}")
@@ -237,7 +289,7 @@ async def search_youtube(request: YouTubeRequest):
         return {
             "success": True,
             "data": response,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _iso_now_cached()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching YouTube: {str(e)}")
@@ -255,7 +307,7 @@ async def get_api_quotas():
                 "gemini": gemini_quota,
                 "youtube": youtube_quota
             },
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _iso_now_cached()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting quotas: {str(e)}")
@@ -280,7 +332,7 @@ async def update_api_keys(request: APIKeyRequest):
         return {
             "success": True,
             "data": {"updated_keys": updated},
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _iso_now_cached()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating keys: {str(e)}")
@@ -290,7 +342,7 @@ async def api_health_check():
     """Health check endpoint for Docker and monitoring"""
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": _iso_now_cached(),
         "version": "1.0.0",
         "services": {
             "gemini": bool(gemini_service.api_key),
@@ -317,9 +369,29 @@ async def get_example_topics():
     return {
         "success": True,
         "data": examples,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": _iso_now_cached()
     }
 
+# Serve index.html at "/" (with ETag/Last-Modified and 304 handling). A route rather than a
+# catch-all mount, so unknown paths and methods still get 404/405 from the router
+app.router.add_route(
+    "/",
+    StaticFiles(directory=str(_frontend_dir), html=True),
+    methods=["GET", "HEAD"],
+    name="frontend",
+    include_in_schema=False
+)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # loop="auto" selects uvloop when it is installed (it is unavailable on Windows);
+    # access logging is left off since requests are already logged to Discord
+    uvicorn.run(
+        "backend.main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        access_log=False
+    )
\ No newline at end of file
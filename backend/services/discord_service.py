@@ -1,192 +1,322 @@
 import os
 import httpx
 import json
+import orjson
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 import asyncio
+import re
 from urllib.parse import urlparse
 
+# Bounds for background webhook delivery
+_QUEUE_MAXSIZE = 500
+
+# Discord webhook message limits
+_MAX_EMBEDS_PER_MESSAGE = 10
+_MAX_EMBED_CHARS_PER_MESSAGE = 6000
+_MAX_TITLE_CHARS = 256
+_MAX_FIELD_VALUE_CHARS = 1024
+
+# How long to wait for more logs before flushing, and how many to take per flush
+_BATCH_WINDOW = 0.5
+_MAX_LOGS_PER_FLUSH = 50
+
+# Keys containing any of these words are redacted before logging
+_SENSITIVE_KEY_RE = re.compile(r"api_key|password|token|secret|key", re.IGNORECASE)
+
+# Larger payloads are truncated anyway, so they are serialized without indentation
+_INDENT_MAX_KEYS = 20
+
+# Fixed leading fields of a request log embed: (name, inline)
+_REQUEST_FIELDS = (
+    ("📍 Endpoint", True),
+    ("🔢 Status Code", True),
+    ("⏱️ Processing Time", True),
+    ("🌍 Client IP", True),
+    ("🔧 User Agent", False),
+)
+
+# Webhook identity per log type
+_REQUEST_PROFILE = (
+    ("username", "Prompt Template API Bot"),
+    ("avatar_url", "https://cdn.discordapp.com/embed/avatars/0.png"),
+)
+_VISITOR_PROFILE = (
+    ("username", "Prompt Template Visitor Tracker"),
+    ("avatar_url", "https://cdn.discordapp.com/embed/avatars/1.png"),
+)
+_ERROR_PROFILE = (
+    ("username", "Prompt Template Error Bot"),
+    ("avatar_url", "https://cdn.discordapp.com/embed/avatars/2.png"),
+)
+
+def _cap(s: str, n: int) -> str:
+    """Truncate a string to n characters, marking the cut with '...'"""
+    return s if len(s) <= n else s[:n] + "..."
+
 class DiscordWebhookService:
     """Service for sending logs and notifications to Discord via webhook"""
     
     def __init__(self):
         self.webhook_url = os.getenv("DISCORD_WEBHOOK_URL")
         self.enabled = bool(self.webhook_url)
-        
-    async def send_request_log(
-        self, 
-        method: str, 
-        endpoint: str, 
-        user_ip: str, 
-        user_agent: str,
-        status_code: int,
-        response_data: Any = None,
-        request_data: Any = None,
-        processing_time: float = 0.0
-    ):
-        """Send request log to Discord webhook"""
-        if not self.enabled:
+        # Shared client so webhook posts reuse keep-alive connections to Discord;
+        # created by start() so a restarted app never posts through a closed client
+        self._client: Optional[httpx.AsyncClient] = None
+        # Pending logs are bounded; anything beyond the cap is dropped and counted
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_MAXSIZE)
+        self._flusher: Optional[asyncio.Task] = None
+        self.dropped_logs = 0
+    
+    def start(self):
+        """Start the background task that batches and delivers queued logs"""
+        if not self.enabled or self._flusher:
             return
-            
-        try:
-            # Create embed for the request log
-            embed = {
-                "title": f"🌐 API Request - {method} {endpoint}",
-                "color": self._get_status_color(status_code),
-                "timestamp": datetime.utcnow().isoformat(),
-                "fields": [
-                    {
-                        "name": "📍 Endpoint",
-                        "value": f"`{method} {endpoint}`",
-                        "inline": True
-                    },
-                    {
-                        "name": "🔢 Status Code",
-                        "value": f"`{status_code}`",
-                        "inline": True
-                    },
-                    {
-                        "name": "⏱️ Processing Time",
-                        "value": f"`{processing_time:.3f}s`",
-                        "inline": True
-                    },
-                    {
-                        "name": "🌍 Client IP",
-                        "value": f"`{user_ip}`",
-                        "inline": True
-                    },
-                    {
-                        "name": "🔧 User Agent",
-                        "value": f"`{user_agent[:100]}...`" if len(user_agent) > 100 else f"`{user_agent}`",
-                        "inline": False
-                    }
-                ]
-            }
-            
-            # Add request data if present
-            if request_data:
-                request_str = self._format_data(request_data)
-                if request_str:
-                    embed["fields"].append({
-                        "name": "📤 Request Data",
-                        "value": f"```json\n{request_str}\n```",
-                        "inline": False
-                    })
-            
-            # Add response data if present (truncated for Discord limits)
-            if response_data:
-                response_str = self._format_data(response_data, max_length=800)
-                if response_str:
-                    embed["fields"].append({
-                        "name": "📥 Response Data",
-                        "value": f"```json\n{response_str}\n```",
-                        "inline": False
-                    })
-            
-            payload = {
-                "embeds": [embed],
-                "username": "Prompt Template API Bot",
-                "avatar_url": "https://cdn.discordapp.com/embed/avatars/0.png"
-            }
-            
-            await self._send_webhook(payload)
-            
-        except Exception as e:
-            print(f"Error sending Discord webhook: {e}")
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=3.0,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+                headers={"Content-Type": "application/json"}
+            )
+        self._flusher = asyncio.create_task(self._flush_loop())
+    
+    async def aclose(self):
+        """Stop the background flusher, close the HTTP client and drop undelivered logs"""
+        if self._flusher:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        # The queue's waiters are bound to this event loop; a later start() may run on another
+        self._queue = asyncio.Queue(maxsize=_QUEUE_MAXSIZE)
+    
+    # Coroutines so Starlette runs them on the event loop rather than in its
+    # thread pool when used as background tasks (asyncio.Queue is not thread-safe)
+    async def enqueue_request_log(self, *args, **kwargs):
+        """Queue a request log without blocking the caller"""
+        self._enqueue(_REQUEST_PROFILE, self._build_request_embed, args, kwargs)
     
-    async def send_visitor_log(self, user_ip: str, user_agent: str, referer: str = None):
-        """Send visitor log to Discord webhook"""
+    async def enqueue_visitor_log(self, *args, **kwargs):
+        """Queue a visitor log without blocking the caller"""
+        self._enqueue(_VISITOR_PROFILE, self._build_visitor_embed, args, kwargs)
+    
+    async def enqueue_error_log(self, *args, **kwargs):
+        """Queue an error log without blocking the caller"""
+        self._enqueue(_ERROR_PROFILE, self._build_error_embed, args, kwargs)
+    
+    def _enqueue(self, profile: tuple, builder, args: tuple, kwargs: dict):
+        """Put a log on the queue, dropping it if the queue is full"""
         if not self.enabled:
             return
-            
         try:
-            embed = {
-                "title": "👋 New Visitor",
-                "color": 0x00ff00,  # Green
-                "timestamp": datetime.utcnow().isoformat(),
-                "fields": [
-                    {
-                        "name": "🌍 IP Address",
-                        "value": f"`{user_ip}`",
-                        "inline": True
-                    },
-                    {
-                        "name": "⏰ Visit Time",
-                        "value": f"`{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}`",
-                        "inline": True
-                    },
-                    {
-                        "name": "🔧 User Agent",
-                        "value": f"`{user_agent[:150]}...`" if len(user_agent) > 150 else f"`{user_agent}`",
-                        "inline": False
-                    }
-                ]
-            }
+            self._queue.put_nowait((profile, builder, args, kwargs))
+        except asyncio.QueueFull:
+            self.dropped_logs += 1
+    
+    async def _flush_loop(self):
+        """Collect logs arriving within a short window and post them together"""
+        while True:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(_BATCH_WINDOW)
+            while len(batch) < _MAX_LOGS_PER_FLUSH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
             
-            if referer:
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                print(f"Discord flush error: {e} (non-critical)")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    async def _flush(self, batch: List[tuple]):
+        """Build embeds for a batch of logs and send one message per chunk"""
+        # Group by webhook identity, keeping the order logs arrived in
+        grouped: Dict[tuple, List[dict]] = {}
+        for profile, builder, args, kwargs in batch:
+            try:
+                embed = builder(*args, **kwargs)
+            except Exception as e:
+                print(f"Error building Discord embed: {e}")
+                continue
+            grouped.setdefault(profile, []).append(embed)
+        
+        for profile, embeds in grouped.items():
+            for chunk in self._chunk_embeds(embeds):
+                await self._send_webhook({"embeds": chunk, **dict(profile)})
+    
+    def _chunk_embeds(self, embeds: List[dict]) -> List[List[dict]]:
+        """Split embeds so each message stays within Discord's count and size limits"""
+        chunks = []
+        current = []
+        current_chars = 0
+        for embed in embeds:
+            self._fit_embed(embed)
+            size = self._embed_size(embed)
+            if current and (
+                len(current) >= _MAX_EMBEDS_PER_MESSAGE
+                or current_chars + size > _MAX_EMBED_CHARS_PER_MESSAGE
+            ):
+                chunks.append(current)
+                current = []
+                current_chars = 0
+            current.append(embed)
+            current_chars += size
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def _fit_embed(self, embed: dict):
+        """Truncate a title or field values over Discord's limits so one embed can't fail its whole message"""
+        title = embed.get("title", "")
+        if len(title) > _MAX_TITLE_CHARS:
+            embed["title"] = _cap(title, _MAX_TITLE_CHARS - 3)
+        for field in embed.get("fields", []):
+            if len(field["value"]) > _MAX_FIELD_VALUE_CHARS:
+                field["value"] = _cap(field["value"], _MAX_FIELD_VALUE_CHARS - 3)
+    
+    def _embed_size(self, embed: dict) -> int:
+        """Count the characters Discord includes in its embed size limit"""
+        size = len(embed.get("title", ""))
+        for field in embed.get("fields", []):
+            size += len(field["name"]) + len(field["value"])
+        return size
+    
+    def _build_request_embed(
+        self,
+        method: str,
+        endpoint: str,
+        user_ip: str,
+        user_agent: str,
+        status_code: int,
+        response_data: Any = None,
+        request_data: Any = None,
+        processing_time: float = 0.0,
+        timestamp: Optional[str] = None
+    ) -> dict:
+        """Build the embed for a request log"""
+        ua_short = _cap(user_agent, 100)
+        values = (
+            f"`{method} {endpoint}`",
+            f"`{status_code}`",
+            f"`{processing_time:.3f}s`",
+            f"`{user_ip}`",
+            f"`{ua_short}`",
+        )
+        embed = {
+            "title": f"🌐 API Request - {method} {endpoint}",
+            "color": self._get_status_color(status_code),
+            "timestamp": timestamp or datetime.utcnow().isoformat(),
+            "fields": [
+                {"name": name, "value": value, "inline": inline}
+                for (name, inline), value in zip(_REQUEST_FIELDS, values)
+            ]
+        }
+        
+        # Add request data if present (truncated to fit a field with its code fence)
+        if request_data:
+            request_str = self._format_data(request_data, max_length=1000)
+            if request_str:
                 embed["fields"].append({
-                    "name": "🔗 Referer",
-                    "value": f"`{referer}`",
+                    "name": "📤 Request Data",
+                    "value": f"```json\n{request_str}\n```",
                     "inline": False
                 })
-            
-            payload = {
-                "embeds": [embed],
-                "username": "Prompt Template Visitor Tracker",
-                "avatar_url": "https://cdn.discordapp.com/embed/avatars/1.png"
-            }
-            
-            await self._send_webhook(payload)
-            
-        except Exception as e:
-            print(f"Error sending visitor webhook: {e}")
-    
-    async def send_error_log(self, error: str, endpoint: str, user_ip: str, traceback: str = None):
-        """Send error log to Discord webhook"""
-        if not self.enabled:
-            return
-            
-        try:
-            embed = {
-                "title": "🚨 Application Error",
-                "color": 0xff0000,  # Red
-                "timestamp": datetime.utcnow().isoformat(),
-                "fields": [
-                    {
-                        "name": "❌ Error",
-                        "value": f"`{error[:500]}...`" if len(error) > 500 else f"`{error}`",
-                        "inline": False
-                    },
-                    {
-                        "name": "📍 Endpoint",
-                        "value": f"`{endpoint}`",
-                        "inline": True
-                    },
-                    {
-                        "name": "🌍 Client IP",
-                        "value": f"`{user_ip}`",
-                        "inline": True
-                    }
-                ]
-            }
-            
-            if traceback:
+        
+        # Add response data if present (truncated for Discord limits)
+        if response_data:
+            response_str = self._format_data(response_data, max_length=800)
+            if response_str:
                 embed["fields"].append({
-                    "name": "📋 Traceback",
-                    "value": f"```python\n{traceback[:1000]}...\n```" if len(traceback) > 1000 else f"```python\n{traceback}\n```",
+                    "name": "📥 Response Data",
+                    "value": f"```json\n{response_str}\n```",
                     "inline": False
                 })
-            
-            payload = {
-                "embeds": [embed],
-                "username": "Prompt Template Error Bot",
-                "avatar_url": "https://cdn.discordapp.com/embed/avatars/2.png"
-            }
-            
-            await self._send_webhook(payload)
-            
-        except Exception as e:
-            print(f"Error sending error webhook: {e}")
+        
+        return embed
+    
+    def _build_visitor_embed(
+        self,
+        user_ip: str,
+        user_agent: str,
+        referer: str = None,
+        timestamp: Optional[str] = None
+    ) -> dict:
+        """Build the embed for a visitor log"""
+        embed = {
+            "title": "👋 New Visitor",
+            "color": 0x00ff00,  # Green
+            "timestamp": timestamp or datetime.utcnow().isoformat(),
+            "fields": [
+                {
+                    "name": "🌍 IP Address",
+                    "value": f"`{user_ip}`",
+                    "inline": True
+                },
+                {
+                    "name": "⏰ Visit Time",
+                    "value": f"`{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}`",
+                    "inline": True
+                },
+                {
+                    "name": "🔧 User Agent",
+                    "value": f"`{_cap(user_agent, 150)}`",
+                    "inline": False
+                }
+            ]
+        }
+        
+        if referer:
+            embed["fields"].append({
+                "name": "🔗 Referer",
+                "value": f"`{referer}`",
+                "inline": False
+            })
+        
+        return embed
+    
+    def _build_error_embed(
+        self,
+        error: str,
+        endpoint: str,
+        user_ip: str,
+        traceback: str = None,
+        timestamp: Optional[str] = None
+    ) -> dict:
+        """Build the embed for an error log"""
+        embed = {
+            "title": "🚨 Application Error",
+            "color": 0xff0000,  # Red
+            "timestamp": timestamp or datetime.utcnow().isoformat(),
+            "fields": [
+                {
+                    "name": "❌ Error",
+                    "value": f"`{_cap(error, 500)}`",
+                    "inline": False
+                },
+                {
+                    "name": "📍 Endpoint",
+                    "value": f"`{endpoint}`",
+                    "inline": True
+                },
+                {
+                    "name": "🌍 Client IP",
+                    "value": f"`{user_ip}`",
+                    "inline": True
+                }
+            ]
+        }
+        
+        if traceback:
+            embed["fields"].append({
+                "name": "📋 Traceback",
+                "value": f"```python\n{_cap(traceback, 1000)}\n```",
+                "inline": False
+            })
+        
+        return embed
     
     def _get_status_color(self, status_code: int) -> int:
         """Get Discord embed color based on HTTP status code"""
@@ -202,28 +332,37 @@ class DiscordWebhookService:
     def _format_data(self, data: Any, max_length: int = 1500) -> str:
         """Format data for Discord display"""
         try:
+            if isinstance(data, bytes):
+                # Raw request bodies are parsed here rather than in the middleware
+                try:
+                    data = orjson.loads(data)
+                except ValueError:
+                    data = {"body": "Unable to parse request body"}
+            
             if isinstance(data, dict):
                 # Remove sensitive data
                 cleaned_data = self._clean_sensitive_data(data)
-                formatted = json.dumps(cleaned_data, indent=2, ensure_ascii=False)
+                option = orjson.OPT_INDENT_2 if len(cleaned_data) <= _INDENT_MAX_KEYS else 0
+                try:
+                    formatted = orjson.dumps(cleaned_data, option=option).decode()
+                except TypeError:
+                    # orjson rejects some inputs (e.g. non-str keys); stdlib handles them
+                    formatted = json.dumps(cleaned_data, indent=2, ensure_ascii=False)
             elif isinstance(data, str):
                 formatted = data
             else:
                 formatted = str(data)
             
-            if len(formatted) > max_length:
-                return formatted[:max_length] + "..."
-            return formatted
+            return _cap(formatted, max_length)
         except Exception:
             return str(data)[:max_length]
     
     def _clean_sensitive_data(self, data: dict) -> dict:
         """Remove sensitive information from data"""
-        sensitive_keys = ['api_key', 'password', 'token', 'secret', 'key']
         cleaned = {}
         
         for key, value in data.items():
-            if any(sensitive in key.lower() for sensitive in sensitive_keys):
+            if _SENSITIVE_KEY_RE.search(key) is not None:
                 cleaned[key] = "[REDACTED]" if value else None
             elif isinstance(value, dict):
                 cleaned[key] = self._clean_sensitive_data(value)
@@ -235,17 +374,12 @@ class DiscordWebhookService:
     async def _send_webhook(self, payload: dict):
         """Send payload to Discord webhook (non-blocking with short timeout)"""
         try:
-            # Use a short timeout to avoid blocking requests
-            async with httpx.AsyncClient(timeout=3.0) as client:
-                response = await client.post(
-                    self.webhook_url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                )
-                response.raise_for_status()
+            # Shared client is configured with a short timeout to avoid blocking requests
+            response = await self._client.post(self.webhook_url, json=payload)
+            response.raise_for_status()
         except httpx.TimeoutException:
             print("Discord webhook timeout (non-critical, continuing)")
         except httpx.HTTPStatusError as e:
             print(f"Discord webhook HTTP error: {e.response.status_code} (non-critical)")
         except Exception as e:
-            print(f"Discord webhook error: {e} (non-critical)")
\ No newline at end of file
+            print(f"Discord webhook error: {e} (non-critical)")
@@ -1,27 +1,117 @@
 import os
 import google.generativeai as genai
+from google.generativeai import client as genai_client
 from typing import Dict, Any, Optional
 import asyncio
+import hashlib
+import re
+import threading
+from functools import lru_cache
 from datetime import datetime
+from cachetools import TTLCache
+
+# genai.configure() is process-global, so configuring and binding a client must not interleave
+_configure_lock = threading.Lock()
+
+@lru_cache(maxsize=32)
+def _get_model(api_key: str, model_name: str) -> genai.GenerativeModel:
+    """Build a model bound to its own API key, cached per key"""
+    with _configure_lock:
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(model_name)
+        # Models pick up the default client lazily on first use; bind it now so
+        # later configure() calls for other keys don't affect this model
+        model._client = genai_client.get_default_generative_client()
+    return model
+
+# Matches "topic: X", "topic: **X**" and "topic **X**" in generated prompts; X must be on the same line
+_TOPIC_RE = re.compile(r"topic(?::|\s\*\*)[ \t*]*([^*\n]+)", re.IGNORECASE)
+
+@lru_cache(maxsize=64)
+def _demo_for_topic(topic: str) -> str:
+    """Render the demo response text for a topic"""
+    return f"""# Demo Response for {topic}
+
+## Top YouTube Video Recommendations
+
+Here are carefully curated educational videos for **{topic}**:
+
+### Beginner Level (40%)
+1. **Introduction to {topic}: Complete Beginner's Guide**
+   - Channel: TechEdu Academy
+   - Duration: 25:30
+   - Key Points: Fundamentals, basic concepts, getting started
+   - Why Selected: Perfect entry point with clear explanations
+
+2. **{topic} Explained Simply - Step by Step Tutorial**
+   - Channel: Learn With Me
+   - Duration: 18:45
+   - Key Points: Practical examples, hands-on approach
+   - Why Selected: Excellent for visual learners
+
+### Intermediate Level (40%)
+3. **Advanced {topic} Techniques and Best Practices**
+   - Channel: Pro Developer
+   - Duration: 32:15
+   - Key Points: Industry standards, optimization tips
+   - Why Selected: Bridges beginner to professional level
+
+4. **Real-World {topic} Project Walkthrough**
+   - Channel: Code Masters
+   - Duration: 45:20
+   - Key Points: Complete project, problem-solving
+   - Why Selected: Practical application focus
+
+### Advanced Level (20%)
+5. **Expert-Level {topic} Strategies and Patterns**
+   - Channel: Tech Experts
+   - Duration: 28:10
+   - Key Points: Advanced concepts, scalability
+   - Why Selected: Cutting-edge techniques
+
+*Note: This is a demo response. Connect your Gemini API key for full AI-powered content curation with 60 personalized video recommendations.*
+
+## Key Learning Path
+1. Start with fundamentals
+2. Practice with tutorials
+3. Build real projects
+4. Explore advanced concepts
+5. Stay updated with trends
+
+**Estimated Learning Time**: 40-60 hours for comprehensive understanding
+**Recommended Pace**: 5-7 videos per week with hands-on practice
+"""
 
 class GeminiService:
     """Service for interacting with Google's Gemini API"""
     
+    # Generation settings are the same for every query
+    _GEN_CONFIG = genai.types.GenerationConfig(
+        temperature=0.7,
+        max_output_tokens=2048,
+        top_p=0.9,
+        top_k=40
+    )
+    
     def __init__(self):
         self.api_key = os.getenv("GEMINI_API_KEY")
         self.model_name = "gemini-2.0-flash-exp"
         self.client = None
         self.quota_used = 0
         self.quota_limit = 1000  # Default quota limit
-        
-        if self.api_key:
-            self._initialize_client()
+        # Generated text per (API key, model, prompt), so repeated prompts skip the API call
+        self._response_cache: TTLCache = TTLCache(maxsize=512, ttl=3600)
+        # The client itself is built by warm_up() at app startup
+    
+    async def warm_up(self):
+        """Initialize the client in a worker thread so the first request doesn't pay for it"""
+        if self.api_key and not self.client:
+            await asyncio.to_thread(self._initialize_client)
     
     def _initialize_client(self):
         """Initialize the Gemini client"""
         try:
-            genai.configure(api_key=self.api_key)
-            self.client = genai.GenerativeModel(self.model_name)
+            self.client = _get_model(self.api_key, self.model_name)
         except Exception as e:
             print(f"Error initializing Gemini client: {e}")
             self.client = None
@@ -34,36 +124,63 @@ class GeminiService:
     async def query(self, prompt: str, api_key: Optional[str] = None) -> Dict[str, Any]:
         """Query the Gemini API with the given prompt"""
         
-        # Use provided API key if available
+        # Fall back to lazy initialization if warm_up() has not run
+        if self.api_key and not self.client:
+            self._initialize_client()
+        
+        # Use provided API key if available, without touching the shared client
+        model = self.client
+        working_key = self.api_key
         if api_key and api_key != self.api_key:
-            temp_key = self.api_key
-            self.update_api_key(api_key)
+            working_key = api_key
+            try:
+                model = _get_model(api_key, self.model_name)
+            except Exception as e:
+                print(f"Error initializing Gemini client: {e}")
+                model = None
             
-        if not self.client:
+        if not model:
             return {
                 "error": "Gemini API not configured. Please provide a valid API key.",
                 "demo_response": self._get_demo_response(prompt)
             }
         
+        # Scoped to the key so callers are never served text another key paid for
+        cache_key = hashlib.sha256(
+            "\0".join((working_key, self.model_name, prompt)).encode()
+        ).digest()
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            return {
+                **cached,
+                "timestamp": datetime.now().isoformat(),
+                "quota_used": self.quota_used,
+                "cached": True,
+                "success": True
+            }
+        
         try:
             # Generate content using Gemini
             response = await asyncio.to_thread(
-                self.client.generate_content,
+                model.generate_content,
                 prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    max_output_tokens=2048,
-                    top_p=0.9,
-                    top_k=40
-                )
+                generation_config=self._GEN_CONFIG
             )
             
             self.quota_used += 1
             
-            return {
+            # Prefer the SDK's token count; fall back to a rough word count
+            tokens_used = getattr(getattr(response, "usage_metadata", None), "candidates_token_count", None)
+            
+            result = {
                 "response": response.text,
                 "model": self.model_name,
-                "tokens_used": len(response.text.split()),
+                "tokens_used": tokens_used or (response.text.count(" ") + 1)
+            }
+            self._response_cache[cache_key] = result
+            
+            return {
+                **result,
                 "timestamp": datetime.now().isoformat(),
                 "quota_used": self.quota_used,
                 "success": True
@@ -75,79 +192,17 @@ class GeminiService:
                 "demo_response": self._get_demo_response(prompt),
                 "success": False
             }
-        
-        finally:
-            # Restore original API key if temporary key was used
-            if api_key and api_key != temp_key:
-                self.update_api_key(temp_key)
     
     def _get_demo_response(self, prompt: str) -> Dict[str, Any]:
         """Generate a demo response when API is not available"""
         topic = "the requested topic"
         
         # Extract topic from prompt if possible
-        if "topic:" in prompt.lower() or "topic **" in prompt.lower():
-            lines = prompt.split('\n')
-            for line in lines:
-                if 'topic:' in line.lower() or 'topic **' in line.lower():
-                    # Extract topic name
-                    if '**' in line:
-                        topic = line.split('**')[1].split('**')[0].strip()
-                    else:
-                        topic = line.split(':')[1].strip()
-                    break
+        match = _TOPIC_RE.search(prompt)
+        if match and match.group(1).strip():
+            topic = match.group(1).strip()
         
-        demo_content = f"""# Demo Response for {topic}
-
-## Top YouTube Video Recommendations
-
-Here are carefully curated educational videos for **{topic}**:
-
-### Beginner Level (40%)
-1. **Introduction to {topic}: Complete Beginner's Guide**
-   - Channel: TechEdu Academy
-   - Duration: 25:30
-   - Key Points: Fundamentals, basic concepts, getting started
-   - Why Selected: Perfect entry point with clear explanations
-
-2. **{topic} Explained Simply - Step by Step Tutorial**
-   - Channel: Learn With Me
-   - Duration: 18:45
-   - Key Points: Practical examples, hands-on approach
-   - Why Selected: Excellent for visual learners
-
-### Intermediate Level (40%)
-3. **Advanced {topic} Techniques and Best Practices**
-   - Channel: Pro Developer
-   - Duration: 32:15
-   - Key Points: Industry standards, optimization tips
-   - Why Selected: Bridges beginner to professional level
-
-4. **Real-World {topic} Project Walkthrough**
-   - Channel: Code Masters
-   - Duration: 45:20
-   - Key Points: Complete project, problem-solving
-   - Why Selected: Practical application focus
-
-### Advanced Level (20%)
-5. **Expert-Level {topic} Strategies and Patterns**
-   - Channel: Tech Experts
-   - Duration: 28:10
-   - Key Points: Advanced concepts, scalability
-   - Why Selected: Cutting-edge techniques
-
-*Note: This is a demo response. Connect your Gemini API key for full AI-powered content curation with 60 personalized video recommendations.*
-
-## Key Learning Path
-1. Start with fundamentals
-2. Practice with tutorials
-3. Build real projects
-4. Explore advanced concepts
-5. Stay updated with trends
-
-**Estimated Learning Time**: 40-60 hours for comprehensive understanding
-**Recommended Pace**: 5-7 videos per week with hands-on practice
-"""
+        demo_content = _demo_for_topic(topic)
         
         return {
             "content": demo_content,
@@ -1,11 +1,100 @@
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Any, Optional
 
+# Topic categories as (keywords that must all appear, category), checked in order
+_TOPIC_RULES = (
+    (("prompt", "engineering"), "prompt_engineering"),
+    (("python", "data"), "python_data"),
+    (("machine learning",), "machine_learning"),
+    (("web development",), "web_development"),
+    (("devops",), "devops"),
+    (("ci/cd",), "devops"),
+    (("cloud computing",), "cloud"),
+    (("aws",), "cloud"),
+    (("cybersecurity",), "cybersecurity"),
+    (("marketing",), "marketing"),
+    (("blockchain",), "blockchain"),
+)
+
+_TOPIC_DESCRIPTIONS = {
+    "prompt_engineering": "mastering the art and science of crafting effective prompts for AI systems, including techniques for optimization, testing, and real-world applications",
+    "python_data": "using Python for data analysis, visualization, and machine learning workflows with practical, hands-on experience",
+    "machine_learning": "understanding ML algorithms, implementation techniques, and real-world application strategies",
+    "web_development": "building modern, responsive web applications with current best practices and industry standards",
+    "devops": "implementing continuous integration/deployment pipelines and modern DevOps practices",
+    "cloud": "leveraging cloud platforms for scalable, cost-effective solutions and modern architecture patterns",
+    "cybersecurity": "protecting digital assets through security best practices, threat assessment, and risk management",
+    "marketing": "effective digital marketing strategies, analytics, and customer engagement techniques",
+    "blockchain": "understanding blockchain technology, cryptocurrencies, and decentralized application development",
+}
+
+_TOPIC_GUIDANCE = {
+    "prompt_engineering": """- Focus on practical prompt design patterns and techniques
+- Include examples for different AI models (GPT, Claude, Gemini, etc.)
+- Cover prompt optimization, testing methodologies, and iteration strategies
+- Emphasize real-world use cases in business, education, and development
+- Include content on prompt security and best practices""",
+    "python_data": """- Prioritize hands-on tutorials with real datasets
+- Cover essential libraries: pandas, numpy, matplotlib, seaborn, scikit-learn
+- Include data cleaning, analysis, visualization, and modeling workflows
+- Focus on practical projects and case studies
+- Emphasize best practices for data science workflows""",
+    "machine_learning": """- Balance theoretical understanding with practical implementation
+- Cover supervised, unsupervised, and reinforcement learning
+- Include model evaluation, hyperparameter tuning, and deployment
+- Focus on popular frameworks like scikit-learn, TensorFlow, PyTorch
+- Emphasize real-world problem-solving approaches""",
+    "web_development": """- Focus on modern frameworks and best practices
+- Cover both frontend and backend development concepts
+- Include responsive design, accessibility, and performance optimization
+- Emphasize project-based learning with portfolio examples
+- Cover deployment and production considerations""",
+}
+
+_TOPIC_FOCUS_AREAS = {
+    "prompt_engineering": (
+        "Prompt Design Patterns", "AI Model Optimization", "Testing & Iteration",
+        "Real-world Applications", "Security & Best Practices"
+    ),
+    "python_data": (
+        "Data Analysis", "Visualization", "Machine Learning",
+        "Data Cleaning", "Statistical Analysis"
+    ),
+    "machine_learning": (
+        "Algorithms & Theory", "Implementation", "Model Evaluation",
+        "Deployment", "Real-world Applications"
+    ),
+}
+
+_DEFAULT_FOCUS_AREAS = (
+    "Fundamentals", "Practical Applications", "Best Practices",
+    "Advanced Techniques", "Industry Insights"
+)
+
+def _classify_topic(topic: str) -> Optional[str]:
+    """Map a topic to its category in a single pass over the rules"""
+    topic_lower = topic.lower()
+    for keywords, category in _TOPIC_RULES:
+        if all(keyword in topic_lower for keyword in keywords):
+            return category
+    return None
+
 class PromptTemplateService:
     """Service for generating dynamic prompt templates based on topics"""
     
     def __init__(self):
         self.base_template = self._get_base_template()
+        # Everything but the date depends only on the topic, so the template is split
+        # around the date slot and the topic-dependent halves are rendered once per topic
+        self._template_head, self._template_tail = self.base_template.split("{current_date}")
+        # Words on either side of the date slot that run into the date when joined
+        self._date_word_overlap = (
+            int(not self._template_head[-1:].isspace()) + int(not self._template_tail[:1].isspace())
+        )
+        self._render_topic = lru_cache(maxsize=256)(self._render_topic_parts)
+        # Rendered prompts by (topic, formatted date); entries from earlier days simply stop matching
+        self._render = lru_cache(maxsize=512)(self._render_prompt)
     
     def _get_base_template(self) -> str:
         """Get the base prompt template structure"""
@@ -67,113 +156,56 @@ For each video, provide:
         # Get current date
         current_date = datetime.now().strftime("%B %d, %Y")
         
-        # Generate topic-specific descriptions and guidance
-        topic_description = self._get_topic_description(topic)
-        topic_specific_guidance = self._get_topic_specific_guidance(topic)
-        
-        # Format the template with dynamic content
-        formatted_prompt = self.base_template.format(
-            topic=topic,
-            current_date=current_date,
-            topic_description=topic_description,
-            topic_specific_guidance=topic_specific_guidance
-        )
+        prompt_data = self._render(topic, current_date)
+        # Copy so callers can't modify the cached result
+        return {**prompt_data, "focus_areas": list(prompt_data["focus_areas"])}
+    
+    def _render_prompt(self, topic: str, current_date: str) -> Dict[str, Any]:
+        """Render the prompt for a topic on a given date"""
+        head, tail, topic_word_count, focus_areas = self._render_topic(topic)
+        formatted_prompt = head + current_date + tail
         
         return {
             "topic": topic,
             "prompt": formatted_prompt,
-            "word_count": len(formatted_prompt.split()),
+            "word_count": topic_word_count + len(current_date.split()) - self._date_word_overlap,
             "character_count": len(formatted_prompt),
             "generated_at": current_date,
             "template_version": "1.0",
-            "focus_areas": self._get_focus_areas(topic)
+            "focus_areas": focus_areas
         }
     
-    def _get_topic_description(self, topic: str) -> str:
-        """Generate a description of what learners need for this topic"""
-        topic_lower = topic.lower()
+    def _render_topic_parts(self, topic: str) -> tuple:
+        """Render the template halves around the date slot for a topic"""
+        category = _classify_topic(topic)
         
-        if "prompt" in topic_lower and "engineering" in topic_lower:
-            return "mastering the art and science of crafting effective prompts for AI systems, including techniques for optimization, testing, and real-world applications"
-        elif "python" in topic_lower and "data" in topic_lower:
-            return "using Python for data analysis, visualization, and machine learning workflows with practical, hands-on experience"
-        elif "machine learning" in topic_lower:
-            return "understanding ML algorithms, implementation techniques, and real-world application strategies"
-        elif "web development" in topic_lower:
-            return "building modern, responsive web applications with current best practices and industry standards"
-        elif "devops" in topic_lower or "ci/cd" in topic_lower:
-            return "implementing continuous integration/deployment pipelines and modern DevOps practices"
-        elif "cloud computing" in topic_lower or "aws" in topic_lower:
-            return "leveraging cloud platforms for scalable, cost-effective solutions and modern architecture patterns"
-        elif "cybersecurity" in topic_lower:
-            return "protecting digital assets through security best practices, threat assessment, and risk management"
-        elif "marketing" in topic_lower:
-            return "effective digital marketing strategies, analytics, and customer engagement techniques"
-        elif "blockchain" in topic_lower:
-            return "understanding blockchain technology, cryptocurrencies, and decentralized application development"
-        else:
-            return f"gaining comprehensive knowledge and practical skills in {topic} with real-world applications"
+        # Generate topic-specific descriptions and guidance
+        fields = {
+            "topic": topic,
+            "topic_description": self._get_topic_description(topic, category),
+            "topic_specific_guidance": self._get_topic_specific_guidance(topic, category)
+        }
+        head = self._template_head.format(**fields)
+        tail = self._template_tail.format(**fields)
+        
+        return head, tail, len(head.split()) + len(tail.split()), self._get_focus_areas(category)
+    
+    def _get_topic_description(self, topic: str, category: Optional[str]) -> str:
+        """Generate a description of what learners need for this topic"""
+        if category in _TOPIC_DESCRIPTIONS:
+            return _TOPIC_DESCRIPTIONS[category]
+        return f"gaining comprehensive knowledge and practical skills in {topic} with real-world applications"
     
-    def _get_topic_specific_guidance(self, topic: str) -> str:
+    def _get_topic_specific_guidance(self, topic: str, category: Optional[str]) -> str:
         """Generate specific guidance for the topic"""
-        topic_lower = topic.lower()
-        
-        if "prompt" in topic_lower and "engineering" in topic_lower:
-            return """- Focus on practical prompt design patterns and techniques
-- Include examples for different AI models (GPT, Claude, Gemini, etc.)
-- Cover prompt optimization, testing methodologies, and iteration strategies
-- Emphasize real-world use cases in business, education, and development
-- Include content on prompt security and best practices"""
-        
-        elif "python" in topic_lower and "data" in topic_lower:
-            return """- Prioritize hands-on tutorials with real datasets
-- Cover essential libraries: pandas, numpy, matplotlib, seaborn, scikit-learn
-- Include data cleaning, analysis, visualization, and modeling workflows
-- Focus on practical projects and case studies
-- Emphasize best practices for data science workflows"""
-        
-        elif "machine learning" in topic_lower:
-            return """- Balance theoretical understanding with practical implementation
-- Cover supervised, unsupervised, and reinforcement learning
-- Include model evaluation, hyperparameter tuning, and deployment
-- Focus on popular frameworks like scikit-learn, TensorFlow, PyTorch
-- Emphasize real-world problem-solving approaches"""
-        
-        elif "web development" in topic_lower:
-            return """- Focus on modern frameworks and best practices
-- Cover both frontend and backend development concepts
-- Include responsive design, accessibility, and performance optimization
-- Emphasize project-based learning with portfolio examples
-- Cover deployment and production considerations"""
-        
-        else:
-            return f"""- Focus on practical, actionable content for {topic}
+        if category in _TOPIC_GUIDANCE:
+            return _TOPIC_GUIDANCE[category]
+        return f"""- Focus on practical, actionable content for {topic}
 - Prioritize hands-on tutorials and real-world examples
 - Include both foundational concepts and advanced techniques
 - Emphasize industry best practices and current trends
 - Ensure content is suitable for various skill levels"""
     
-    def _get_focus_areas(self, topic: str) -> list:
-        """Get key focus areas for the topic"""
-        topic_lower = topic.lower()
-        
-        if "prompt" in topic_lower and "engineering" in topic_lower:
-            return [
-                "Prompt Design Patterns", "AI Model Optimization", "Testing & Iteration",
-                "Real-world Applications", "Security & Best Practices"
-            ]
-        elif "python" in topic_lower and "data" in topic_lower:
-            return [
-                "Data Analysis", "Visualization", "Machine Learning",
-                "Data Cleaning", "Statistical Analysis"
-            ]
-        elif "machine learning" in topic_lower:
-            return [
-                "Algorithms & Theory", "Implementation", "Model Evaluation",
-                "Deployment", "Real-world Applications"
-            ]
-        else:
-            return [
-                "Fundamentals", "Practical Applications", "Best Practices",
-                "Advanced Techniques", "Industry Insights"
-            ]
\ No newline at end of file
+    def _get_focus_areas(self, category: Optional[str]) -> tuple:
+        """Get key focus areas for the topic category"""
+        return _TOPIC_FOCUS_AREAS.get(category, _DEFAULT_FOCUS_AREAS)
\ No newline at end of file
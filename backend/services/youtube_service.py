@@ -2,8 +2,46 @@ import os
 import httpx
 from typing import Dict, Any, Optional, List
 import asyncio
-from datetime import datetime, timedelta
+import hashlib
+import itertools
+import random
+import sys
+from datetime import datetime, timedelta, timezone
 import json
+import orjson
+import re
+from collections import Counter
+from cachetools import TTLCache
+
+# ISO-8601 durations as returned by the API, e.g. PT1H2M3S
+_DURATION_RE = re.compile(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?')
+
+# datetime.fromisoformat() accepts the API's trailing "Z" from Python 3.11
+_FROMISOFORMAT_ACCEPTS_Z = sys.version_info >= (3, 11)
+
+# Keyword sets used for scoring; matched as substrings of lowercased text
+_BEGINNER_RE = re.compile(r'beginner|introduction|basics|getting started|101|fundamentals')
+_ADVANCED_RE = re.compile(r'advanced|expert|master|professional|deep dive|complex')
+_EDUCATIONAL_RE = re.compile(r'tutorial|guide|course|learn|explained|fundamentals|beginner')
+
+# API responses and finished searches are reused for this long (seconds)
+_CACHE_TTL = 6 * 3600
+
+# Transient API failures are retried with jittered exponential backoff
+_RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+_MAX_ATTEMPTS = 3
+_RETRY_BASE_DELAY = 0.25
+
+# Partial-response masks limiting payloads to the fields read below
+_SEARCH_FIELDS = "items(id/videoId,snippet/title)"
+_VIDEO_FIELDS = (
+    "items(id,snippet(title,description,channelTitle,publishedAt,thumbnails/medium/url),"
+    "statistics(viewCount,likeCount,commentCount),contentDetails/duration)"
+)
+
+def _key_digest(api_key: str) -> bytes:
+    """Identify an API key in cache keys without storing the key itself"""
+    return hashlib.sha256(api_key.encode()).digest()
 
 class YouTubeService:
     """Service for interacting with YouTube Data API v3"""
@@ -14,6 +52,63 @@ class YouTubeService:
         self.quota_used = 0
         self.quota_limit = 10000  # Default daily quota
         self.requests_made = 0
+        # Created on first use and shared so requests reuse (and multiplex over) one connection
+        self._client: Optional[httpx.AsyncClient] = None
+        # Search batches, detail batches and finished searches, each keyed with a digest of
+        # the API key that paid for it; hits cost no quota
+        self._cache: TTLCache = TTLCache(maxsize=1024, ttl=_CACHE_TTL)
+        # Topic-independent demo fields, built once; see _get_demo_videos()
+        self._demo_skeleton = [
+            {
+                "id": f"demo_{i+1}",
+                "channel_title": f"Educational Channel {i+1}",
+                "duration": 1200 + (i * 300),
+                "duration_formatted": f"{20 + i*5}:00",
+                "view_count": 50000 - (i * 5000),
+                "like_count": 2000 - (i * 200),
+                "comment_count": 150 - (i * 15),
+                "days_old": i * 30,
+                "quality_score": 8.5 - (i * 0.3),
+                "difficulty_level": ["Beginner", "Intermediate", "Advanced"][i % 3],
+                "url": f"https://www.youtube.com/watch?v=demo_{i+1}",
+                "thumbnail": f"https://img.youtube.com/vi/demo_{i+1}/medium.jpg",
+                "engagement_rate": 4.2 - (i * 0.2),
+                "relevance_score": 0.9 - (i * 0.05)
+            }
+            for i in range(10)  # Limit demo to 10 videos
+        ]
+    
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Get the shared HTTP/2 client, creating it on first use"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=True,
+                timeout=10.0,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+            )
+        return self._client
+    
+    async def aclose(self):
+        """Close the shared HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def _api_get(self, client: httpx.AsyncClient, endpoint: str, params: Dict[str, Any]) -> Dict:
+        """GET an API endpoint, retrying rate limits, server errors and dropped connections"""
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                response = await client.get(f"{self.base_url}/{endpoint}", params=params)
+                response.raise_for_status()
+                return orjson.loads(response.content)
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                retryable = (
+                    not isinstance(e, httpx.HTTPStatusError)
+                    or e.response.status_code in _RETRY_STATUS_CODES
+                )
+                if not retryable or attempt == _MAX_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(_RETRY_BASE_DELAY * 2 ** attempt + random.random() * 0.1)
     
     def update_api_key(self, api_key: str):
         """Update the YouTube API key"""
@@ -33,37 +128,70 @@ class YouTubeService:
         if not working_key:
             return self._get_demo_videos(topic, max_results)
         
+        result_key = ("result", _key_digest(working_key), topic, max_results)
+        cached = self._cache.get(result_key)
+        if cached is not None:
+            return {
+                **cached,
+                "timestamp": datetime.now().isoformat(),
+                "cached": True
+            }
+        
         try:
-            videos = []
             search_queries = self._generate_search_queries(topic)
             results_per_query = max(1, max_results // len(search_queries))
             
-            async with httpx.AsyncClient() as client:
-                for query in search_queries:
-                    batch = await self._search_batch(
-                        client, query, working_key, results_per_query
-                    )
-                    videos.extend(batch)
-                    
+            client = await self._get_client()
+            # Run all search queries concurrently
+            batches = await asyncio.gather(
+                *(
+                    self._search_batch(client, query, working_key, results_per_query)
+                    for query in search_queries
+                ),
+                return_exceptions=True
+            )
+            
+            # Keep the queries that succeeded; only fail if all of them did
+            errors = [batch for batch in batches if isinstance(batch, Exception)]
+            if len(errors) == len(batches):
+                raise errors[0]
+            
+            # Queries overlap heavily, so drop repeated video IDs before fetching details
+            videos = []
+            seen_ids = set()
+            for video in itertools.chain.from_iterable(
+                batch for batch in batches if not isinstance(batch, Exception)
+            ):
+                video_id = video.get("id", {}).get("videoId")
+                if video_id and video_id not in seen_ids:
+                    seen_ids.add(video_id)
+                    videos.append(video)
                     if len(videos) >= max_results:
                         break
             
             # Get detailed video information
-            video_details = await self._get_video_details(videos[:max_results], working_key)
+            video_details = await self._get_video_details(videos, working_key)
             
             # Analyze and sort videos
             analyzed_videos = self._analyze_videos(video_details, topic)
             
-            return {
+            result = {
                 "videos": analyzed_videos,
                 "total_found": len(analyzed_videos),
                 "topic": topic,
                 "search_queries_used": search_queries,
                 "quota_cost": self._calculate_quota_cost(len(analyzed_videos)),
                 "analytics": self._generate_analytics(analyzed_videos),
-                "timestamp": datetime.now().isoformat(),
                 "success": True
             }
+            # Partial results are not kept; the successful batches are cached already
+            if not errors:
+                self._cache[result_key] = result
+            
+            return {
+                **result,
+                "timestamp": datetime.now().isoformat()
+            }
             
         except Exception as e:
             return {
@@ -112,6 +240,10 @@ class YouTubeService:
         max_results: int
     ) -> List[Dict]:
         """Search for a batch of videos with a specific query"""
+        cache_key = ("search", _key_digest(api_key), query, max_results)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         params = {
             "part": "snippet",
@@ -120,17 +252,17 @@ class YouTubeService:
             "maxResults": min(max_results, 50),  # API limit
             "order": "relevance",
             "videoDuration": "medium",  # 4-20 minutes
+            "fields": _SEARCH_FIELDS,
             "key": api_key
         }
         
-        response = await client.get(f"{self.base_url}/search", params=params)
-        response.raise_for_status()
-        
-        data = response.json()
+        data = await self._api_get(client, "search", params)
         self.quota_used += 100  # Search costs 100 quota units
         self.requests_made += 1
         
-        return data.get("items", [])
+        items = data.get("items", [])
+        self._cache[cache_key] = items
+        return items
     
     async def _get_video_details(self, videos: List[Dict], api_key: str) -> List[Dict]:
         """Get detailed information for videos"""
@@ -144,34 +276,51 @@ class YouTubeService:
         
         # Split into batches of 50 (API limit)
         batches = [video_ids[i:i+50] for i in range(0, len(video_ids), 50)]
-        all_details = []
-        
-        async with httpx.AsyncClient() as client:
-            for batch in batches:
-                params = {
-                    "part": "snippet,statistics,contentDetails",
-                    "id": ",".join(batch),
-                    "key": api_key
-                }
-                
-                response = await client.get(f"{self.base_url}/videos", params=params)
-                response.raise_for_status()
-                
-                data = response.json()
-                all_details.extend(data.get("items", []))
-                self.quota_used += 1  # Videos list costs 1 quota unit per request
         
-        return all_details
+        client = await self._get_client()
+        results = await asyncio.gather(
+            *(self._get_details_batch(client, batch, api_key) for batch in batches)
+        )
+        
+        return [item for items in results for item in items]
+    
+    async def _get_details_batch(self, client: httpx.AsyncClient, video_ids: List[str], api_key: str) -> List[Dict]:
+        """Fetch details for up to 50 video IDs"""
+        cache_key = ("videos", _key_digest(api_key), tuple(video_ids))
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        params = {
+            "part": "snippet,statistics,contentDetails",
+            "id": ",".join(video_ids),
+            "fields": _VIDEO_FIELDS,
+            "key": api_key
+        }
+        
+        data = await self._api_get(client, "videos", params)
+        self.quota_used += 1  # Videos list costs 1 quota unit per request
+        
+        items = data.get("items", [])
+        self._cache[cache_key] = items
+        return items
     
     def _analyze_videos(self, videos: List[Dict], topic: str) -> List[Dict]:
         """Analyze and score videos based on quality metrics"""
         analyzed = []
+        now_utc = datetime.now(timezone.utc)
+        # Topic tokens are the same for every video
+        topic_lower = topic.lower()
+        topic_words = topic_lower.split()
         
         for video in videos:
             try:
                 snippet = video.get("snippet", {})
                 stats = video.get("statistics", {})
                 content_details = video.get("contentDetails", {})
+                title = snippet.get("title", "")
+                description = snippet.get("description", "")
+                title_lower = title.lower()
                 
                 # Extract metrics
                 view_count = int(stats.get("viewCount", 0))
@@ -182,20 +331,23 @@ class YouTubeService:
                 duration = self._parse_duration(content_details.get("duration", "PT0S"))
                 
                 # Calculate publish date
-                published_at = datetime.fromisoformat(
-                    snippet.get("publishedAt", "").replace("Z", "+00:00")
-                )
-                days_old = (datetime.now(published_at.tzinfo) - published_at).days
+                published_raw = snippet.get("publishedAt")
+                if not published_raw:
+                    continue
+                if not _FROMISOFORMAT_ACCEPTS_Z:
+                    published_raw = published_raw.replace("Z", "+00:00")
+                published_at = datetime.fromisoformat(published_raw)
+                days_old = (now_utc - published_at).days
                 
                 # Calculate quality score
                 quality_score = self._calculate_quality_score(
-                    view_count, like_count, comment_count, days_old, duration, snippet.get("title", ""), topic
+                    view_count, like_count, comment_count, days_old, duration, title_lower, topic_lower
                 )
                 
                 analyzed_video = {
                     "id": video["id"],
-                    "title": snippet.get("title", ""),
-                    "description": snippet.get("description", "")[:200] + "...",
+                    "title": title,
+                    "description": description[:200] + "...",
                     "channel_title": snippet.get("channelTitle", ""),
                     "published_at": published_at.isoformat(),
                     "duration": duration,
@@ -205,11 +357,11 @@ class YouTubeService:
                     "comment_count": comment_count,
                     "days_old": days_old,
                     "quality_score": quality_score,
-                    "difficulty_level": self._determine_difficulty(snippet.get("title", ""), snippet.get("description", "")),
+                    "difficulty_level": self._determine_difficulty(title, description),
                     "url": f"https://www.youtube.com/watch?v={video['id']}",
                     "thumbnail": snippet.get("thumbnails", {}).get("medium", {}).get("url", ""),
                     "engagement_rate": self._calculate_engagement_rate(view_count, like_count, comment_count),
-                    "relevance_score": self._calculate_relevance_score(snippet.get("title", ""), topic)
+                    "relevance_score": self._calculate_relevance_score(title_lower, topic_words)
                 }
                 
                 analyzed.append(analyzed_video)
@@ -230,20 +382,19 @@ class YouTubeService:
         comments: int, 
         days_old: int, 
         duration: int, 
-        title: str, 
-        topic: str
+        title_lower: str, 
+        topic_lower: str
     ) -> float:
-        """Calculate a quality score for the video"""
+        """Calculate a quality score for the video from its lowercased title and topic"""
         score = 0.0
         
-        # View count score (logarithmic scale)
         if views > 0:
+            # View count score (logarithmic scale)
             score += min(10, (views / 1000) ** 0.5)
-        
-        # Engagement score
-        if views > 0:
-            like_ratio = likes / views if views > 0 else 0
-            comment_ratio = comments / views if views > 0 else 0
+            
+            # Engagement score
+            like_ratio = likes / views
+            comment_ratio = comments / views
             score += (like_ratio * 1000) + (comment_ratio * 5000)
         
         # Recency bonus (prefer newer content)
@@ -257,26 +408,32 @@ class YouTubeService:
             score += 1
         
         # Title relevance
-        title_lower = title.lower()
-        topic_lower = topic.lower()
         if topic_lower in title_lower:
             score += 3
         
         # Educational keywords bonus
-        educational_keywords = ["tutorial", "guide", "course", "learn", "explained", "fundamentals", "beginner"]
-        for keyword in educational_keywords:
-            if keyword in title_lower:
-                score += 1
-                break
+        if _EDUCATIONAL_RE.search(title_lower):
+            score += 1
         
         return round(score, 2)
     
     def _parse_duration(self, duration_str: str) -> int:
         """Parse YouTube duration format (PT1H2M3S) to seconds"""
-        import re
-        
-        pattern = r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?'
-        match = re.match(pattern, duration_str)
+        # Fast path for the common sub-hour PT#M#S form
+        if duration_str.startswith("PT") and "H" not in duration_str:
+            minutes, m_sep, rest = duration_str[2:].partition("M")
+            if not m_sep:
+                minutes, rest = "", minutes
+            seconds, s_sep, trailing = rest.partition("S")
+            # Each unit found must have digits before it, as the regex requires
+            if (
+                (minutes.isdigit() if m_sep else True)
+                and (seconds.isdigit() if s_sep else not rest)
+                and not trailing
+            ):
+                return int(minutes or 0) * 60 + int(seconds or 0)
+        
+        match = _DURATION_RE.match(duration_str)
         
         if not match:
             return 0
@@ -302,11 +459,9 @@ class YouTubeService:
         """Determine difficulty level based on title and description"""
         content = (title + " " + description).lower()
         
-        beginner_keywords = ["beginner", "introduction", "basics", "getting started", "101", "fundamentals"]
-        advanced_keywords = ["advanced", "expert", "master", "professional", "deep dive", "complex"]
-        
-        beginner_count = sum(1 for keyword in beginner_keywords if keyword in content)
-        advanced_count = sum(1 for keyword in advanced_keywords if keyword in content)
+        # Count distinct keywords present, as repeats of one keyword don't add weight
+        beginner_count = len(set(_BEGINNER_RE.findall(content)))
+        advanced_count = len(set(_ADVANCED_RE.findall(content)))
         
         if beginner_count > advanced_count:
             return "Beginner"
@@ -323,11 +478,8 @@ class YouTubeService:
         engagement = (likes + comments) / views * 100
         return round(engagement, 3)
     
-    def _calculate_relevance_score(self, title: str, topic: str) -> float:
-        """Calculate how relevant the video is to the topic"""
-        title_lower = title.lower()
-        topic_words = topic.lower().split()
-        
+    def _calculate_relevance_score(self, title_lower: str, topic_words: List[str]) -> float:
+        """Calculate how relevant the video is to the topic's lowercased words"""
         relevance = 0.0
         for word in topic_words:
             if word in title_lower:
@@ -346,62 +498,52 @@ class YouTubeService:
         if not videos:
             return {}
         
-        total_views = sum(v["view_count"] for v in videos)
-        total_likes = sum(v["like_count"] for v in videos)
-        total_duration = sum(v["duration"] for v in videos)
-        
-        difficulty_distribution = {}
+        # Accumulate every statistic in one pass over the videos
+        total_views = total_likes = total_duration = 0
+        total_quality = 0.0
+        difficulty_distribution = Counter()
+        channel_counts = Counter()
         for video in videos:
-            level = video["difficulty_level"]
-            difficulty_distribution[level] = difficulty_distribution.get(level, 0) + 1
+            total_views += video["view_count"]
+            total_likes += video["like_count"]
+            total_duration += video["duration"]
+            total_quality += video["quality_score"]
+            difficulty_distribution[video["difficulty_level"]] += 1
+            channel = video["channel_title"]
+            if channel:
+                channel_counts[channel] += 1
         
         return {
             "total_videos": len(videos),
             "total_views": total_views,
             "total_likes": total_likes,
-            "average_views": total_views // len(videos) if videos else 0,
-            "average_duration": total_duration // len(videos) if videos else 0,
+            "average_views": total_views // len(videos),
+            "average_duration": total_duration // len(videos),
             "total_watch_time_hours": round(total_duration / 3600, 1),
-            "difficulty_distribution": difficulty_distribution,
-            "top_channels": self._get_top_channels(videos),
-            "average_quality_score": round(sum(v["quality_score"] for v in videos) / len(videos), 2)
+            "difficulty_distribution": dict(difficulty_distribution),
+            "top_channels": self._get_top_channels(channel_counts),
+            "average_quality_score": round(total_quality / len(videos), 2)
         }
     
-    def _get_top_channels(self, videos: List[Dict]) -> List[Dict]:
+    def _get_top_channels(self, channel_counts: Counter) -> List[Dict]:
         """Get top channels by video count"""
-        channel_counts = {}
-        for video in videos:
-            channel = video["channel_title"]
-            if channel:
-                channel_counts[channel] = channel_counts.get(channel, 0) + 1
-        
-        sorted_channels = sorted(channel_counts.items(), key=lambda x: x[1], reverse=True)
-        return [{"name": name, "count": count} for name, count in sorted_channels[:5]]
+        # most_common(n) uses a heap rather than sorting every channel
+        return [{"name": name, "count": count} for name, count in channel_counts.most_common(5)]
     
     def _get_demo_videos(self, topic: str, max_results: int) -> Dict[str, Any]:
         """Generate demo video data when API is not available"""
-        demo_videos = []
-        
-        for i in range(min(max_results, 10)):  # Limit demo to 10 videos
-            demo_videos.append({
-                "id": f"demo_{i+1}",
+        count = max(0, min(max_results, len(self._demo_skeleton)))
+        now = datetime.now()
+        description = f"This is a comprehensive tutorial covering {topic} fundamentals and practical applications. Perfect for learners at all levels."
+        demo_videos = [
+            {
+                **video,
                 "title": f"{topic} Tutorial #{i+1} - Complete Guide",
-                "description": f"This is a comprehensive tutorial covering {topic} fundamentals and practical applications. Perfect for learners at all levels.",
-                "channel_title": f"Educational Channel {i+1}",
-                "published_at": (datetime.now() - timedelta(days=i*30)).isoformat(),
-                "duration": 1200 + (i * 300),
-                "duration_formatted": f"{20 + i*5}:00",
-                "view_count": 50000 - (i * 5000),
-                "like_count": 2000 - (i * 200),
-                "comment_count": 150 - (i * 15),
-                "days_old": i * 30,
-                "quality_score": 8.5 - (i * 0.3),
-                "difficulty_level": ["Beginner", "Intermediate", "Advanced"][i % 3],
-                "url": f"https://www.youtube.com/watch?v=demo_{i+1}",
-                "thumbnail": f"https://img.youtube.com/vi/demo_{i+1}/medium.jpg",
-                "engagement_rate": 4.2 - (i * 0.2),
-                "relevance_score": 0.9 - (i * 0.05)
-            })
+                "description": description,
+                "published_at": (now - timedelta(days=video["days_old"])).isoformat()
+            }
+            for i, video in enumerate(self._demo_skeleton[:count])
+        ]
         
         return {
             "videos": demo_videos,
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Behaviour checks for the backend services that need no API keys or network
+"""
+import sys
+
+from backend.services.gemini_service import GeminiService
+from backend.services import youtube_service
+
+def test_demo_topic_extraction():
+    """Topics are read from the prompt's topic line only"""
+    service = GeminiService()
+    cases = [
+        ("TASK: Curate videos for the topic: **Python**\nCurrent Date: May 1", "Python"),
+        ("topic: Rust", "Rust"),
+        ("**Topic:** \nCurrent Date: May 1", "the requested topic"),
+        ("topic:\nnext", "the requested topic"),
+    ]
+    for prompt, expected in cases:
+        topic = service._get_demo_response(prompt)["topic"]
+        assert topic == expected, f"{prompt!r}: expected {expected!r}, got {topic!r}"
+
+def _regex_duration(duration_str):
+    """Reference parse of an API duration using only the regex"""
+    match = youtube_service._DURATION_RE.match(duration_str)
+    if not match:
+        return 0
+    hours, minutes, seconds = (int(group or 0) for group in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+def test_parse_duration_matches_regex():
+    """The PT#M#S fast path agrees with the regex, including malformed input"""
+    service = youtube_service.YouTubeService()
+    for duration_str in ["PT12M3S", "PT5M", "PT45S", "PT1H2M", "PT0S", "PT1M2", "PTM7S", "PT", "PTS", "P1D"]:
+        expected = _regex_duration(duration_str)
+        parsed = service._parse_duration(duration_str)
+        assert parsed == expected, f"{duration_str!r}: expected {expected}, got {parsed}"
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+
+    failed = False
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            failed = True
+
+    sys.exit(1 if failed else 0)